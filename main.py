@@ -2,10 +2,42 @@ import discord
 from discord.ext import commands
 import os
 import sys
-import json
+import io
 import time
+import asyncio
+import atexit
+import logging
+import logging.handlers
+import queue
+from collections import OrderedDict, deque
+from operator import attrgetter
 from dotenv import load_dotenv
-from claude_agent_sdk import ClaudeSDKClient, ClaudeAgentOptions, HookMatcher
+from claude_agent_sdk import ClaudeSDKClient, ClaudeAgentOptions, HookMatcher, TextBlock
+
+# orjson is much faster for history encoding; fall back to stdlib json if missing
+try:
+    import orjson
+    json_dumps = orjson.dumps
+    json_loads = orjson.loads
+except ImportError:
+    import json
+
+    def json_dumps(obj) -> bytes:
+        return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode()
+
+    json_loads = json.loads
+
+# Log through a queue so formatting and stdout writes happen off the event loop
+log_queue = queue.Queue(-1)
+log_handler = logging.StreamHandler(sys.stdout)
+log_handler.setFormatter(logging.Formatter('%(levelname)s %(message)s'))
+log_listener = logging.handlers.QueueListener(log_queue, log_handler)
+logger = logging.getLogger('improvement_ai')
+logger.setLevel(logging.INFO)
+logger.addHandler(logging.handlers.QueueHandler(log_queue))
+logger.propagate = False
+log_listener.start()
+atexit.register(log_listener.stop)
 
 # Load environment variables
 load_dotenv()
@@ -14,9 +46,18 @@ DISCORD_TOKEN = os.getenv('DISCORD_TOKEN')
 # Bot setup with intents
 intents = discord.Intents.default()
 intents.message_content = True
-intents.members = True
 
-bot = commands.Bot(command_prefix='!', intents=intents)
+# Skip member chunking on connect and keep a smaller message cache; the bot
+# only reacts to new messages and never looks up members or old messages
+bot = commands.Bot(
+    command_prefix='!',
+    intents=intents,
+    chunk_guilds_at_startup=False,
+    max_messages=1000
+)
+
+# Bot's own user ID, cached at login for the self-message check
+bot_user_id = None
 
 # Project directory
 project_dir = os.path.dirname(os.path.abspath(__file__))
@@ -32,12 +73,42 @@ async def auto_approve_hook(input_data, tool_use_id, context):
         }
     }
 
+# Bot instructions, sent as the system prompt. Kept byte-stable (the project
+# path is fixed per process) so the prefix stays prompt-cached.
+SYSTEM_PROMPT = f"""You are a Discord bot running on an EC2 instance with sudo privileges. You are connected to Claude Code and can modify your own code in real-time.
+
+THE GAME:
+- You are an LLM that can see and modify its own source code
+- You have full access to the filesystem, shell, internet via the EC2 instance
+- Users will interact with you through Discord messages
+- You can evolve yourself by editing main.py and other files
+- When you modify core code, create .restart_bot to apply changes
+- Conversation history persists across restarts
+
+RULES:
+1. DO IT IMMEDIATELY - No asking for permission
+2. Be creative and have fun with your capabilities
+3. Don't break the bot (but you can always fix it)
+4. Users are testing your ability to self-modify and improve
+
+CAPABILITIES:
+- Full filesystem access (read/write any file)
+- Shell commands with sudo
+- Internet/browser access
+- Git operations
+- Edit main.py to add new behaviors
+- Create .restart_bot to restart yourself
+
+PROJECT LOCATION: {project_dir}"""
+
 # Claude Code client options
 claude_options = ClaudeAgentOptions(
     # Allow all tools - Claude Code has filesystem, shell, browser, etc.
     allowed_tools="*",
     # Set working directory to project root
     cwd=project_dir,
+    # Bot instructions as the system prompt
+    system_prompt=SYSTEM_PROMPT,
     # Auto-approve all tool usage
     hooks={
         "PreToolUse": [
@@ -46,45 +117,234 @@ claude_options = ClaudeAgentOptions(
     }
 )
 
-# Store active Claude sessions per channel
-claude_sessions = {}
+# Store active Claude sessions per channel, least recently used first
+MAX_LIVE_SESSIONS = 64
+claude_sessions = OrderedDict()
+
+# Pre-initialized Claude clients handed out to new channels
+CLIENT_POOL_SIZE = 2
+client_pool = asyncio.Queue()
+client_pool_task = None
+
+# Pending messages and worker task per channel
+channel_queues = {}
+channel_tasks = {}
 
-# Conversation history file
-HISTORY_FILE = os.path.join(project_dir, '.conversation_history.json')
+# Maximum Claude requests in flight across all channels
+MAX_INFLIGHT = 16
+claude_semaphore = asyncio.Semaphore(MAX_INFLIGHT)
+
+# Channels currently handling a message; their sessions are never evicted
+busy_channels = set()
+
+# Conversation history: one append-only JSON Lines file per channel
+HISTORY_DIR = os.path.join(project_dir, '.history')
+# Single-file history written by older versions, migrated on first load
+LEGACY_HISTORY_FILE = os.path.join(project_dir, '.conversation_history.json')
 conversation_history = {}
 
+# Messages kept per channel
+HISTORY_LIMIT = 50
+
+# Lines in each channel's file on disk; a file is compacted back down to
+# HISTORY_LIMIT lines once appends would grow it past twice that
+history_line_counts = {}
+
+# Messages not written to disk yet, and channels whose file must be rewritten
+pending_history = {}
+pending_rewrites = set()
+
+# Channels whose file could not be read; their in-memory history is incomplete,
+# so they are only ever appended to, never compacted or rewritten
+unreadable_channels = set()
+
+def history_path(channel_id: str) -> str:
+    return os.path.join(HISTORY_DIR, f'{channel_id}.jsonl')
+
 # Load conversation history from disk
 def load_conversation_history():
     global conversation_history
     try:
-        if os.path.exists(HISTORY_FILE):
-            with open(HISTORY_FILE, 'r') as f:
-                conversation_history = json.load(f)
-            print(f"✓ Loaded conversation history for {len(conversation_history)} channels")
+        if os.path.isdir(HISTORY_DIR):
+            with os.scandir(HISTORY_DIR) as entries:
+                for entry in entries:
+                    if entry.name.endswith('.jsonl'):
+                        load_channel_history(entry)
+        elif os.path.exists(LEGACY_HISTORY_FILE):
+            with open(LEGACY_HISTORY_FILE, 'rb') as f:
+                conversation_history = {
+                    channel_id: deque(messages, maxlen=HISTORY_LIMIT)
+                    for channel_id, messages in json_loads(f.read()).items()
+                }
+            # Written out to HISTORY_DIR on the next save
+            pending_rewrites.update(conversation_history.keys())
+        else:
+            return
+        logger.info(f"✓ Loaded conversation history for {len(conversation_history)} channels")
     except Exception as e:
-        print(f"Warning: Could not load conversation history: {e}")
+        logger.warning(f"Could not load conversation history: {e}")
         conversation_history = {}
-
-# Save conversation history to disk
-def save_conversation_history():
+        history_line_counts.clear()
+        pending_rewrites.clear()
+
+def load_channel_history(entry):
+    channel_id = entry.name[:-len('.jsonl')]
+    messages = deque(maxlen=HISTORY_LIMIT)
+    lines = 0
+    torn = False
     try:
-        with open(HISTORY_FILE, 'w') as f:
-            json.dump(conversation_history, f, indent=2)
-    except Exception as e:
-        print(f"Warning: Could not save conversation history: {e}")
+        with open(entry.path, 'rb') as f:
+            for line in f:
+                lines += 1
+                try:
+                    messages.append(json_loads(line))
+                except ValueError:
+                    torn = True
+    except OSError as e:
+        # Leave this channel's file alone rather than dropping every channel
+        logger.warning(f"Could not load conversation history for {channel_id}: {e}")
+        unreadable_channels.add(channel_id)
+        return
+    conversation_history[channel_id] = messages
+    history_line_counts[channel_id] = lines
+    if torn:
+        # Torn write from a crash; rewrite the file cleanly
+        pending_rewrites.add(channel_id)
+
+# Encode messages as JSON Lines, dropping any entry that can't be encoded
+def encode_history(channel_id: str, messages) -> bytes:
+    lines = []
+    for msg in messages:
+        try:
+            lines.append(json_dumps(msg) + b'\n')
+        except (TypeError, ValueError) as e:
+            logger.warning(f"Dropping unencodable history entry for {channel_id}: {e}")
+    return b''.join(lines)
+
+# Save conversation history to disk; returns the channels that failed
+def save_conversation_history(appends: dict, rewrites: dict) -> set:
+    failed = set()
+    try:
+        os.makedirs(HISTORY_DIR, exist_ok=True)
+    except OSError as e:
+        logger.warning(f"Could not save conversation history: {e}")
+        return set(appends) | set(rewrites)
+
+    # New messages go in a single O_APPEND write per channel
+    for channel_id, messages in appends.items():
+        try:
+            data = encode_history(channel_id, messages)
+            fd = os.open(history_path(channel_id), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                # os.write may write less than asked; keep going until done
+                view = memoryview(data)
+                while view:
+                    view = view[os.write(fd, view):]
+            finally:
+                os.close(fd)
+        except (OSError, TypeError, ValueError) as e:
+            logger.warning(f"Could not save conversation history for {channel_id}: {e}")
+            failed.add(channel_id)
+
+    # Compacted files are written to a temp file and swapped in
+    for channel_id, messages in rewrites.items():
+        path = history_path(channel_id)
+        tmp_file = path + '.tmp'
+        try:
+            with open(tmp_file, 'wb') as f:
+                f.write(encode_history(channel_id, messages))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_file, path)
+        except (OSError, TypeError, ValueError) as e:
+            logger.warning(f"Could not save conversation history for {channel_id}: {e}")
+            failed.add(channel_id)
+    return failed
+
+# Coalesce history writes: changes are flushed at most once per HISTORY_SAVE_DELAY
+HISTORY_SAVE_DELAY = 1.0
+history_flush_handle = None
+history_save_lock = asyncio.Lock()
+
+def schedule_history_save():
+    global history_flush_handle
+    if history_flush_handle is None:
+        loop = asyncio.get_running_loop()
+        history_flush_handle = loop.call_later(
+            HISTORY_SAVE_DELAY, lambda: asyncio.create_task(flush_conversation_history())
+        )
+
+def take_pending_history():
+    """Split pending changes into per-channel appends and full rewrites"""
+    global pending_history
+    appends, pending_history = pending_history, {}
+    for channel_id, messages in appends.items():
+        if channel_id in unreadable_channels:
+            continue
+        if history_line_counts.get(channel_id, 0) + len(messages) > 2 * HISTORY_LIMIT:
+            pending_rewrites.add(channel_id)
+    # Snapshot on the event loop so the writer thread never sees a deque mid-append
+    rewrites = {
+        channel_id: list(conversation_history.get(channel_id, ()))
+        for channel_id in pending_rewrites
+    }
+    pending_rewrites.clear()
+    for channel_id in rewrites:
+        appends.pop(channel_id, None)
+    return appends, rewrites
+
+def record_saved_history(appends: dict, rewrites: dict, failed: set):
+    for channel_id, messages in appends.items():
+        if channel_id not in failed:
+            history_line_counts[channel_id] = history_line_counts.get(channel_id, 0) + len(messages)
+    for channel_id, messages in rewrites.items():
+        if channel_id not in failed:
+            history_line_counts[channel_id] = len(messages)
+    # The in-memory deque is complete, so a rewrite recovers anything lost
+    pending_rewrites.update(failed - unreadable_channels)
+
+async def flush_conversation_history():
+    global history_flush_handle
+    # Also called directly on shutdown, so drop any flush still pending
+    if history_flush_handle is not None:
+        history_flush_handle.cancel()
+        history_flush_handle = None
+    async with history_save_lock:
+        if not pending_history and not pending_rewrites:
+            return
+        appends, rewrites = take_pending_history()
+        failed = await asyncio.to_thread(save_conversation_history, appends, rewrites)
+        record_saved_history(appends, rewrites, failed)
+
+# Write any unsaved history on interpreter exit
+def save_pending_history():
+    if pending_history or pending_rewrites:
+        save_conversation_history(*take_pending_history())
+
+atexit.register(save_pending_history)
 
 # Add message to history
 def add_to_history(channel_id: str, role: str, content: str):
-    if channel_id not in conversation_history:
-        conversation_history[channel_id] = []
-    conversation_history[channel_id].append({
+    # Lone surrogates can't be encoded as UTF-8 JSON; replace them up front so
+    # the entry can never break a later append or rewrite of this channel
+    try:
+        content.encode('utf-8')
+    except UnicodeEncodeError:
+        content = content.encode('utf-8', 'replace').decode('utf-8')
+    history = conversation_history.get(channel_id)
+    if history is None:
+        history = conversation_history[channel_id] = deque(maxlen=HISTORY_LIMIT)
+    elif history and history[-1]['role'] == role and history[-1]['content'] == content:
+        # Double-send or identical retry; nothing new to store or write
+        return
+    entry = {
         'role': role,
         'content': content
-    })
-    # Keep last 50 messages per channel
-    if len(conversation_history[channel_id]) > 50:
-        conversation_history[channel_id] = conversation_history[channel_id][-50:]
-    save_conversation_history()
+    }
+    # The deque drops the oldest message once HISTORY_LIMIT is reached
+    history.append(entry)
+    pending_history.setdefault(channel_id, []).append(entry)
+    schedule_history_save()
 
 # Check for restart request
 RESTART_FLAG = os.path.join(project_dir, '.restart_bot')
@@ -95,49 +355,131 @@ def check_restart_request():
         return True
     return False
 
+# Poll for the restart flag in the background instead of on every message
+RESTART_POLL_INTERVAL = 1.0
+restart_requested = asyncio.Event()
+restart_watch_task = None
+
+async def watch_restart_flag():
+    while not check_restart_request():
+        await asyncio.sleep(RESTART_POLL_INTERVAL)
+    restart_requested.set()
+
+# Close every live and pre-warmed Claude session in parallel
+async def close_claude_sessions():
+    sessions = list(claude_sessions.values()) + drain_client_pool()
+    claude_sessions.clear()
+    await asyncio.gather(
+        *(session.__aexit__(None, None, None) for session in sessions),
+        return_exceptions=True
+    )
+
 # Restart the bot
 async def restart_bot():
-    print("\n🔄 Bot restart requested...")
+    logger.info("🔄 Bot restart requested...")
     # Cleanup sessions
-    for session in claude_sessions.values():
-        try:
-            await session.__aexit__(None, None, None)
-        except:
-            pass
+    await close_claude_sessions()
+    # Save pending history and flush queued log records; execv skips atexit handlers
+    await flush_conversation_history()
+    log_listener.stop()
     # Restart using the same Python interpreter and script
     os.execv(sys.executable, [sys.executable] + sys.argv)
 
-# Load history on startup
-load_conversation_history()
+
+@bot.event
+async def setup_hook():
+    """Runs once after login, before the gateway connects"""
+    global bot_user_id, restart_watch_task
+    bot_user_id = bot.user.id
+    # Load history off the event loop, before any message can arrive
+    await asyncio.to_thread(load_conversation_history)
+    restart_watch_task = asyncio.create_task(watch_restart_flag())
 
 
 @bot.event
 async def on_ready():
     """Event handler for when the bot is ready"""
-    print(f'\n{"="*50}')
-    print(f'{bot.user} has connected to Discord!')
-    print(f'{"="*50}')
-    print(f'Guilds: {len(bot.guilds)}')
-    print(f'Claude Code: ✓ Active')
-    print(f'Self-Modification: ✓ Enabled')
-    print(f'{"="*50}')
-    print('Bot is ready to receive messages!\n')
+    logger.info(f'{"="*50}')
+    logger.info(f'{bot.user} has connected to Discord!')
+    logger.info(f'{"="*50}')
+    logger.info(f'Guilds: {len(bot.guilds)}')
+    logger.info(f'Claude Code: ✓ Active')
+    logger.info(f'Self-Modification: ✓ Enabled')
+    logger.info(f'{"="*50}')
+    logger.info('Bot is ready to receive messages!')
+    start_client_pool_refill()
+
+
+async def create_claude_client() -> ClaudeSDKClient:
+    """Create and initialize a new Claude client"""
+    client = ClaudeSDKClient(options=claude_options)
+    await client.__aenter__()  # Initialize the session
+    return client
+
+
+async def refill_client_pool():
+    """Top the client pool back up to CLIENT_POOL_SIZE"""
+    while client_pool.qsize() < CLIENT_POOL_SIZE:
+        try:
+            client = await create_claude_client()
+        except Exception as e:
+            logger.warning(f"Could not pre-warm Claude client: {e}")
+            return
+        await client_pool.put(client)
+
+
+def start_client_pool_refill():
+    global client_pool_task
+    if client_pool_task is None or client_pool_task.done():
+        client_pool_task = asyncio.create_task(refill_client_pool())
+
+
+def drain_client_pool() -> list:
+    clients = []
+    while not client_pool.empty():
+        clients.append(client_pool.get_nowait())
+    return clients
+
+
+async def evict_idle_session():
+    """Close the least recently used session that isn't handling a message"""
+    channel_id = next((cid for cid in claude_sessions if cid not in busy_channels), None)
+    if channel_id is None:
+        return
+    session = claude_sessions.pop(channel_id)
+    logger.info(f"Evicting idle Claude session for channel {channel_id[:8]}")
+    # Ask the channel's worker to exit once it has nothing left to do
+    if channel_id in channel_queues:
+        channel_queues[channel_id].put_nowait(None)
+    try:
+        await session.__aexit__(None, None, None)
+    except Exception as e:
+        logger.warning(f"Could not close Claude session for {channel_id[:8]}: {e}")
 
 
 async def get_claude_client(channel_id: str) -> ClaudeSDKClient:
     """Get or create a Claude client for a channel with restored history"""
-    if channel_id not in claude_sessions:
-        client = ClaudeSDKClient(options=claude_options)
-        await client.__aenter__()  # Initialize the session
+    if channel_id in claude_sessions:
+        claude_sessions.move_to_end(channel_id)
+    else:
+        if len(claude_sessions) >= MAX_LIVE_SESSIONS:
+            await evict_idle_session()
+
+        # Use a pre-warmed client if one is ready, otherwise start one now
+        try:
+            client = client_pool.get_nowait()
+        except asyncio.QueueEmpty:
+            client = await create_claude_client()
+        start_client_pool_refill()
 
         # Restore conversation history by including it in first message
         if channel_id in conversation_history and conversation_history[channel_id]:
             history = conversation_history[channel_id]
-            print(f"📚 Restoring {len(history)} messages for channel {channel_id[:8]}...")
+            logger.info(f"📚 Restoring {len(history)} messages for channel {channel_id[:8]}...")
 
             # Create a summary of previous conversation
             history_text = "PREVIOUS CONVERSATION HISTORY:\n"
-            for msg in history[-10:]:  # Last 10 messages
+            for msg in list(history)[-10:]:  # Last 10 messages
                 role = msg['role'].upper()
                 content = msg['content'][:200]  # Truncate long messages
                 history_text += f"{role}: {content}\n"
@@ -150,26 +492,206 @@ async def get_claude_client(channel_id: str) -> ClaudeSDKClient:
     return claude_sessions[channel_id]
 
 
+# Text extractor per content block type, resolved the first time a type is seen
+_BLOCK_EXTRACTORS = {TextBlock: attrgetter('text')}
+
+def _resolve_block_extractor(block):
+    if isinstance(block, str):
+        return lambda b: b
+    if hasattr(block, 'text'):
+        return attrgetter('text')
+    return lambda b: None
+
+def extract_text(block):
+    """Return the text of a response content block, or None if it has none"""
+    extractor = _BLOCK_EXTRACTORS.get(type(block))
+    if extractor is None:
+        extractor = _BLOCK_EXTRACTORS[type(block)] = _resolve_block_extractor(block)
+    return extractor(block)
+
+
+# Text extractor per response message type, resolved the same way
+_MESSAGE_EXTRACTORS = {}
+
+def _content_text(msg):
+    content = msg.content
+    if isinstance(content, str):
+        return [content]
+    if isinstance(content, list):
+        return [text for text in map(extract_text, content) if text is not None]
+    return []
+
+def _resolve_message_extractor(msg):
+    if hasattr(msg, 'content'):
+        return _content_text
+    if hasattr(msg, 'text'):
+        return lambda m: [m.text]
+    return lambda m: []
+
+def extract_message_text(msg):
+    """Return the text parts of a Claude response message"""
+    extractor = _MESSAGE_EXTRACTORS.get(type(msg))
+    if extractor is None:
+        extractor = _MESSAGE_EXTRACTORS[type(msg)] = _resolve_message_extractor(msg)
+    return extractor(msg)
+
+
+# Discord rejects messages longer than this
+DISCORD_MESSAGE_LIMIT = 2000
+
+# Minimum seconds between edits of a streaming reply, to stay under rate limits
+STREAM_EDIT_INTERVAL = 1.0
+
+def split_chunk(text: str, size: int = DISCORD_MESSAGE_LIMIT):
+    """Return the first piece of text (at most size characters) and where the rest begins"""
+    if len(text) <= size:
+        return text, len(text)
+    end = text.rfind('\n', 0, size)
+    if end > 0:
+        return text[:end], end + 1
+    # No newline to break at; hard-split
+    return text[:size], size
+
+
+class StreamedReply:
+    """A Discord reply that is posted while the response streams in
+
+    The newest message is edited in place as text arrives; once it fills up
+    it is left as is and the rest continues in a new message.
+    """
+
+    def __init__(self, channel):
+        self.channel = channel
+        self.buf = io.StringIO()
+        self.tail = ''  # text belonging to the current message
+        self.message = None
+        self.shown = ''
+        self.last_sync = 0.0
+        self.lock = asyncio.Lock()
+        self.flush_task = None
+        self.flush_waiting = False  # flush_task is still sleeping, safe to cancel
+
+    async def write(self, text: str):
+        self.buf.write(text)
+        self.buf.write('\n')
+        self.tail += text + '\n'
+        wait = STREAM_EDIT_INTERVAL - (time.monotonic() - self.last_sync)
+        if wait <= 0:
+            await self.sync()
+        elif self.flush_task is None or self.flush_task.done():
+            # Rate-limited; make sure this text still shows up once the interval ends
+            self.flush_waiting = True
+            self.flush_task = asyncio.create_task(self.sync_later(wait))
+
+    async def sync_later(self, delay: float):
+        await asyncio.sleep(delay)
+        self.flush_waiting = False
+        await self.sync()
+
+    async def sync(self):
+        async with self.lock:
+            self.last_sync = time.monotonic()
+            while True:
+                # write() keeps appending while show() awaits, so work on a snapshot
+                tail = self.tail
+                chunk, next_start = split_chunk(tail)
+                await self.show(chunk.strip())
+                if next_start < len(tail):
+                    # Current message is full; continue in a new one
+                    self.tail = self.tail[next_start:]
+                    self.message = None
+                    self.shown = ''
+                elif len(self.tail) == len(tail):
+                    break
+                # Otherwise more text arrived mid-edit; edit the same message again
+
+    async def show(self, text: str):
+        if not text or text == self.shown:
+            return
+        if self.message is None:
+            self.message = await self.channel.send(text)
+        else:
+            await self.message.edit(content=text)
+        self.shown = text
+
+    async def finish(self) -> str:
+        """Push the remaining text and return the full response"""
+        task = self.flush_task
+        if task is not None:
+            # Only cancel while it is sleeping, never in the middle of a send
+            if self.flush_waiting:
+                task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+            except Exception as e:
+                logger.warning(f"Could not update streamed reply: {e}", exc_info=True)
+        await self.sync()
+        return self.buf.getvalue().strip()
+
+
 @bot.event
 async def on_message(message):
     """Event handler for messages"""
     # Ignore messages from the bot itself
-    if message.author == bot.user:
+    if message.author.id == bot_user_id:
         return
 
     # Check for restart request
-    if check_restart_request():
+    if restart_requested.is_set():
+        # Clear first so messages arriving mid-restart don't restart again
+        restart_requested.clear()
         await restart_bot()
         return
 
-    # Process remaining messages with Claude Code
-    content = message.content.strip()
-
-    if not content:
+    # Process remaining messages with Claude Code; attachment- or embed-only
+    # messages have no text, so skip them before allocating a stripped copy
+    raw = message.content
+    if not raw or raw.isspace():
         return
+    content = raw.strip()
 
     channel_id = str(message.channel.id)
 
+    # Hand the message to the channel's worker so a long Claude response
+    # doesn't hold up messages in other channels
+    if channel_id not in channel_queues:
+        channel_queues[channel_id] = asyncio.Queue()
+        channel_tasks[channel_id] = asyncio.create_task(channel_worker(channel_id))
+    await channel_queues[channel_id].put((message, content))
+
+    # Process commands (if any are added in the future)
+    await bot.process_commands(message)
+
+
+async def channel_worker(channel_id: str):
+    """Process queued messages for one channel, in order"""
+    channel_queue = channel_queues[channel_id]
+    while True:
+        item = await channel_queue.get()
+        if item is None:
+            # Session was evicted; exit unless more messages came in meanwhile
+            channel_queue.task_done()
+            if channel_queue.empty() and channel_id not in claude_sessions:
+                del channel_queues[channel_id]
+                del channel_tasks[channel_id]
+                return
+            continue
+        message, content = item
+        busy_channels.add(channel_id)
+        try:
+            async with claude_semaphore:
+                await handle_message(channel_id, message, content)
+        except Exception as e:
+            logger.exception(f"Error in channel worker {channel_id[:8]}: {e}")
+        finally:
+            busy_channels.discard(channel_id)
+            channel_queue.task_done()
+
+
+async def handle_message(channel_id: str, message, content: str):
+    """Send a message to Claude Code and relay the response"""
     # Get or create client
     client = await get_claude_client(channel_id)
 
@@ -179,39 +701,12 @@ async def on_message(message):
         history_context = client._history_context + "\n\n"
         delattr(client, '_history_context')  # Use only once
 
-    # Prepend instructions for first message in channel (only if no history)
-    is_first_message = len(conversation_history.get(channel_id, [])) == 0
-    if is_first_message or history_context:
-        content = f"""You are a Discord bot running on an EC2 instance with sudo privileges. You are connected to Claude Code and can modify your own code in real-time.
-
-THE GAME:
-- You are an LLM that can see and modify its own source code
-- You have full access to the filesystem, shell, internet via the EC2 instance
-- Users will interact with you through Discord messages
-- You can evolve yourself by editing main.py and other files
-- When you modify core code, create .restart_bot to apply changes
-- Conversation history persists across restarts
-
-RULES:
-1. DO IT IMMEDIATELY - No asking for permission
-2. Be creative and have fun with your capabilities
-3. Don't break the bot (but you can always fix it)
-4. Users are testing your ability to self-modify and improve
+    # Store user message in history (store original, not with history context)
+    add_to_history(channel_id, 'user', content)
 
-CAPABILITIES:
-- Full filesystem access (read/write any file)
-- Shell commands with sudo
-- Internet/browser access
-- Git operations
-- Edit main.py to add new behaviors
-- Create .restart_bot to restart yourself
-
-PROJECT LOCATION: {project_dir}
-
-{history_context}User's message: {content}"""
-
-    # Store user message in history (store original, not with system prompt)
-    add_to_history(channel_id, 'user', message.content.strip())
+    # Restored history goes in front of the first message after a restart or eviction
+    if history_context:
+        content = f"{history_context}User's message: {content}"
 
     # Show typing indicator
     async with message.channel.typing():
@@ -220,70 +715,45 @@ PROJECT LOCATION: {project_dir}
             # Send query to Claude Code (client already initialized, just use it)
             await client.query(content)
 
-            # Collect response
-            response_parts = []
+            # Stream the response to Discord as it arrives
+            reply = StreamedReply(message.channel)
             async for msg in client.receive_response():
-                # Try different ways to extract text
-                if hasattr(msg, 'content'):
-                    if isinstance(msg.content, str):
-                        response_parts.append(msg.content)
-                    elif isinstance(msg.content, list):
-                        for block in msg.content:
-                            if isinstance(block, str):
-                                response_parts.append(block)
-                            elif hasattr(block, 'text'):
-                                response_parts.append(block.text)
-                            elif hasattr(block, 'type') and block.type == 'text':
-                                response_parts.append(block.text)
-                elif hasattr(msg, 'text'):
-                    response_parts.append(msg.text)
-
-            response = '\n'.join(response_parts).strip()
+                for text in extract_message_text(msg):
+                    await reply.write(text)
+
+            response = await reply.finish()
 
             if not response:
                 response = "I processed your request but didn't generate a text response."
+                await message.channel.send(response)
 
             # Store assistant response in history
             add_to_history(channel_id, 'assistant', response)
 
-            # Discord has a 2000 character limit
-            if len(response) > 2000:
-                # Split into chunks
-                chunks = [response[i:i+1900] for i in range(0, len(response), 1900)]
-                for chunk in chunks:
-                    await message.channel.send(chunk)
-            else:
-                await message.channel.send(response)
-
         except Exception as e:
-            print(f"Error processing message: {e}")
-            import traceback
-            traceback.print_exc()
+            logger.exception(f"Error processing message: {e}")
             await message.channel.send(f"Sorry, I encountered an error: {str(e)}")
 
-    # Process commands (if any are added in the future)
-    await bot.process_commands(message)
-
 
 async def cleanup():
     """Cleanup Claude sessions on shutdown"""
-    print("Cleaning up Claude Code sessions...")
-    for session in claude_sessions.values():
-        try:
-            await session.__aexit__(None, None, None)
-        except:
-            pass
-    print("Done!")
+    logger.info("Cleaning up Claude Code sessions...")
+    for task in list(channel_tasks.values()):
+        task.cancel()
+    if client_pool_task:
+        client_pool_task.cancel()
+    await close_claude_sessions()
+    await flush_conversation_history()
+    logger.info("Done!")
 
 
 if __name__ == '__main__':
     if not DISCORD_TOKEN:
-        print("Error: DISCORD_TOKEN not found in .env file")
-        print("Please create a .env file with your Discord bot token")
+        logger.error("DISCORD_TOKEN not found in .env file")
+        logger.error("Please create a .env file with your Discord bot token")
     else:
         try:
             bot.run(DISCORD_TOKEN)
         except KeyboardInterrupt:
-            print("\n\nShutting down bot...")
-            import asyncio
+            logger.info("Shutting down bot...")
             asyncio.run(cleanup())